@@ -171,8 +171,7 @@ run_simple_tests() {
     # Try minimal tests first
     if [[ -f "tests/test_minimal.py" ]]; then
         print_info "Running minimal tests..."
-        $PYTHON_CMD tests/test_minimal.py
-        if [[ $? -eq 0 ]]; then
+        if $PYTHON_CMD -m pytest tests/test_minimal.py; then
             print_success "Minimal tests passed"
             ((TOTAL_PASSED++))
         else
@@ -184,8 +183,7 @@ run_simple_tests() {
     # Also try original simple tests
     if [[ -f "tests/test_simple.py" ]]; then
         print_info "Running comprehensive simple tests..."
-        $PYTHON_CMD tests/test_simple.py
-        if [[ $? -eq 0 ]]; then
+        if $PYTHON_CMD -m pytest tests/test_simple.py; then
             print_success "Simple tests passed"
             ((TOTAL_PASSED++))
         else
@@ -8,7 +8,7 @@ echo
 # Test 1: Minimal tests (no dependencies required)
 echo "📋 1. Minimal Tests (Basic Functionality)"
 echo "-------------------------------------------"
-.venv/bin/python tests/test_minimal.py
+.venv/bin/pytest tests/test_minimal.py -v --tb=no -q
 echo
 
 # Test 2: Simple unit tests
@@ -20,7 +20,7 @@ echo
 # Test 3: Integration tests
 echo "🌐 3. Integration Tests (API Endpoints)"
 echo "---------------------------------------"
-.venv/bin/pytest tests/test_integration.py::TestAPIIntegration::test_app_startup tests/test_integration.py::TestAPIIntegration::test_download_audio_invalid_url tests/test_integration.py::TestAPIIntegration::test_openapi_docs_available -v --tb=no -q
+.venv/bin/pytest tests/test_integration.py::TestAPIIntegration::test_app_startup tests/test_integration.py::TestAPIIntegration::test_download_audio_bad_inputs tests/test_integration.py::TestAPIIntegration::test_openapi_docs_available -v --tb=no -q
 echo
 
 # Test 4: Run full test suites that work
@@ -3,55 +3,29 @@ Minimal tests that work with available dependencies
 """
 import sys
 import os
+from importlib.util import find_spec
+
+import pytest
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 # Add parent directory to path
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, PROJECT_ROOT)
 
 def test_basic_imports():
     """Test basic Python imports"""
-    try:
-        import json
-        import os
-        import tempfile
-        from io import BytesIO
-        print("✓ Basic Python modules work")
-        return True  # Imports successful
-    except ImportError as e:
-        print(f"✗ Basic imports failed: {e}")
-        return False
+    import json
+    import tempfile
+    from io import BytesIO
 
 def test_available_dependencies():
     """Test which dependencies are available"""
-    dependencies = {
-        "fastapi": "FastAPI web framework",
-        "pydantic": "Data validation library", 
-        "pytubefix": "YouTube download library",
-        "moviepy": "Video/audio processing",
-        "requests": "HTTP library",
-        "uvicorn": "ASGI server"
-    }
-    
-    available = {}
-    for dep, desc in dependencies.items():
-        try:
-            __import__(dep)
-            available[dep] = True
-            print(f"✓ {dep} - {desc}")
-        except ImportError:
-            available[dep] = False
-            print(f"✗ {dep} - {desc} (not available)")
+    dependencies = ["fastapi", "pydantic", "pytubefix", "requests", "uvicorn"]
+    available = {dep: find_spec(dep) is not None for dep in dependencies}
     
     # Check if we have core dependencies
     core_deps = ["fastapi", "pydantic"]
-    core_available = sum(available.get(dep, False) for dep in core_deps)
-    
-    print(f"\nCore dependencies: {core_available}/{len(core_deps)} available")
-    print(f"Total dependencies: {sum(available.values())}/{len(dependencies)} available")
-    
-    if core_available >= 1:
-        return True
-    else:
-        return False
+    assert any(available[dep] for dep in core_deps)
 
 def test_file_structure():
     """Test that required files exist"""
@@ -61,127 +35,24 @@ def test_file_structure():
         "Dockerfile"
     ]
     
-    existing_files = 0
-    for file in required_files:
-        if os.path.exists(file):
-            print(f"✓ {file} exists")
-            existing_files += 1
-        else:
-            print(f"✗ {file} missing")
-    
-    if existing_files == len(required_files):
-        return True
-    else:
-        return False
+    missing = [file for file in required_files if not os.path.exists(os.path.join(PROJECT_ROOT, file))]
+    assert not missing, f"Missing files: {missing}"
 
 def test_app_import_conditional():
     """Test app import if dependencies are available"""
-    try:
-        # Check if we have the basic dependencies
-        import fastapi
-        import pydantic
-        
-        # Try to import our app
-        try:
-            from youtube_to_mp3 import app, URLItem
-            print("✓ Successfully imported app and URLItem")
-            
-            # Test URLItem
-            url_item = URLItem(url="test")
-            print(f"✓ URLItem works: {url_item.url}")
-            
-            # Test app type
-            if hasattr(app, 'post'):
-                print("✓ App has post method (FastAPI app)")
-                return True
-            else:
-                print("✗ App doesn't seem to be a FastAPI app")
-                return False
-                
-        except Exception as e:
-            print(f"✗ Failed to import app components: {e}")
-            return False
-            
-    except ImportError:
-        print("⚠ FastAPI/Pydantic not available, skipping app import test")
-        return True  # Skip this test if dependencies aren't available - this is acceptable
-
-def test_python_version():
-    """Test Python version compatibility"""
-    version = sys.version_info
-    print(f"Python version: {version.major}.{version.minor}.{version.micro}")
-    
-    if version >= (3, 8):
-        print("✓ Python version is compatible (>=3.8)")
-        return True
-    else:
-        print(f"✗ Python version too old: {version.major}.{version.minor} (requires >=3.8)")
-        return False
-
-def test_filename_sanitization():
-    """Test filename sanitization logic"""
-    test_cases = [
-        ("normal_title", "normal_title"),
-        ("title/with/slashes", "title_with_slashes"),
-        ("title\\with\\backslashes", "title\\with\\backslashes"),
-        ("", ""),
-        ("///", "___"),
-        ("Artist / Song Title", "Artist _ Song Title"),
-    ]
-    
-    all_passed = True
-    for input_title, expected in test_cases:
-        result = input_title.replace("/", "_")
-        if result == expected:
-            print(f"✓ '{input_title}' -> '{result}'")
-        else:
-            print(f"✗ '{input_title}' -> '{result}' (expected '{expected}')")
-            all_passed = False
-    
-    return all_passed
-
-def run_minimal_tests():
-    """Run minimal test suite"""
-    tests = [
-        ("Python Version", test_python_version),
-        ("Basic Imports", test_basic_imports),
-        ("File Structure", test_file_structure),
-        ("Available Dependencies", test_available_dependencies),
-        ("App Import (Conditional)", test_app_import_conditional),
-        ("Filename Sanitization", test_filename_sanitization),
-    ]
-    
-    print("Running Minimal Tests for YouTube to MP3 Converter")
-    print("=" * 55)
-    
-    passed = 0
-    total = len(tests)
+    # Skip this test if dependencies aren't available - this is acceptable
+    pytest.importorskip("fastapi")
+    pytest.importorskip("pydantic")
     
-    for test_name, test_func in tests:
-        print(f"\n{test_name}:")
-        print("-" * len(test_name))
-        try:
-            if test_func():
-                passed += 1
-                print(f"✓ {test_name} PASSED")
-            else:
-                print(f"✗ {test_name} FAILED")
-        except Exception as e:
-            print(f"✗ {test_name} FAILED with exception: {e}")
+    from youtube_to_mp3 import app, URLItem
     
-    print(f"\n{'='*55}")
-    print(f"Results: {passed}/{total} tests passed")
+    # Test URLItem
+    url_item = URLItem(url="test")
+    assert url_item.url == "test"
     
-    if passed == total:
-        print("🎉 All tests passed!")
-        return True
-    elif passed >= total - 1:
-        print("✅ Most tests passed - good enough!")
-        return True
-    else:
-        print("❌ Multiple tests failed")
-        return False
+    # Test app type
+    assert hasattr(app, 'post')
 
-if __name__ == "__main__":
-    success = run_minimal_tests()
-    sys.exit(0 if success else 1)
\ No newline at end of file
+def test_python_version():
+    """Test Python version compatibility"""
+    assert sys.version_info >= (3, 8), "Python >= 3.8 is required"
@@ -1,13 +1,16 @@
 """
 Performance tests for YouTube to MP3 converter API
 Tests response times, memory usage, and concurrent requests
+
+Run performance tests: pytest tests/test_performance.py -v -m "performance"
+Run load tests: pytest tests/test_performance.py -v -m "load"
 """
 import pytest
-import time
-import threading
+import asyncio
+import gc
+from time import perf_counter_ns
 import statistics
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from fastapi.testclient import TestClient
+import httpx
 import sys
 import os
 
@@ -19,80 +22,108 @@ try:
 except ImportError:
     app = None
 
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+try:
+    import psutil
+    _PROCESS = psutil.Process(os.getpid())
+except ImportError:
+    psutil = None
+    _PROCESS = None
+
+
+# Request bodies pre-serialized once so the load tests only measure the server
+_JSON_HEADERS = {"content-type": "application/json"}
+_INVALID_BODY = b'{"url":"invalid-url"}'
+_INVALID_BODY_TEMPLATE = '{"url":"invalid-url-%d"}'
+
+
+def _memory_mb():
+    """Return the memory usage of the current process in MB"""
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+        if sys.platform == "darwin":
+            return max_rss / 1024 / 1024
+        return max_rss / 1024
+    return _PROCESS.memory_info().rss / 1024 / 1024
+
 
 @pytest.mark.skipif(app is None, reason="Could not import app")
 @pytest.mark.performance
 class TestPerformance:
     """Performance tests for the API"""
     
-    @pytest.fixture
-    def client(self):
-        """Create test client"""
-        return TestClient(app)
-    
-    def test_response_time_invalid_url(self, client):
+    def test_response_time_invalid_url(self, api_client):
         """Test response time for invalid URL (should be fast)"""
-        start_time = time.time()
+        start_time = perf_counter_ns()
         
-        response = client.post(
+        response = api_client.post(
             "/convert/",
             json={"url": "invalid-url"}
         )
         
-        end_time = time.time()
-        response_time = end_time - start_time
+        end_time = perf_counter_ns()
+        response_time = (end_time - start_time) / 1e9
         
         # Should respond quickly for invalid URLs
         assert response_time < 5.0  # Less than 5 seconds
         assert response.status_code == 500
     
-    def test_response_time_malformed_request(self, client):
+    def test_response_time_malformed_request(self, api_client):
         """Test response time for malformed requests"""
-        start_time = time.time()
+        start_time = perf_counter_ns()
         
-        response = client.post(
+        response = api_client.post(
             "/convert/",
             json={}
         )
         
-        end_time = time.time()
-        response_time = end_time - start_time
+        end_time = perf_counter_ns()
+        response_time = (end_time - start_time) / 1e9
         
         # Validation should be very fast
         assert response_time < 1.0  # Less than 1 second
         assert response.status_code == 422
     
-    def test_concurrent_invalid_requests(self, client):
+    @pytest.mark.asyncio
+    async def test_concurrent_invalid_requests(self):
         """Test handling multiple concurrent invalid requests"""
-        def make_request():
-            start_time = time.time()
-            response = client.post(
+        async def make_request(client):
+            start_time = perf_counter_ns()
+            response = await client.post(
                 "/convert/",
-                json={"url": "invalid-url"}
+                content=_INVALID_BODY,
+                headers=_JSON_HEADERS
             )
-            end_time = time.time()
+            end_time = perf_counter_ns()
             return {
                 'status_code': response.status_code,
-                'response_time': end_time - start_time
+                'response_time': (end_time - start_time) / 1e9
             }
         
-        # Test with 10 concurrent requests
+        # Test with 10 concurrent requests against the ASGI app in-process
         num_requests = 10
-        with ThreadPoolExecutor(max_workers=num_requests) as executor:
-            futures = [executor.submit(make_request) for _ in range(num_requests)]
-            results = [future.result() for future in as_completed(futures)]
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            results = await asyncio.gather(*[make_request(client) for _ in range(num_requests)])
         
         # All requests should complete
         assert len(results) == num_requests
         
-        # All should return 500 (server error for invalid URL)
+        # All should return 500 (server error for invalid URL); accumulate
+        # response time stats in the same single pass
+        total_response_time = 0.0
+        max_response_time = 0.0
         for result in results:
             assert result['status_code'] == 500
+            total_response_time += result['response_time']
+            max_response_time = max(max_response_time, result['response_time'])
         
-        # Calculate average response time
-        response_times = [result['response_time'] for result in results]
-        avg_response_time = statistics.mean(response_times)
-        max_response_time = max(response_times)
+        avg_response_time = total_response_time / len(results)
         
         print(f"Average response time: {avg_response_time:.2f}s")
         print(f"Max response time: {max_response_time:.2f}s")
@@ -101,23 +132,29 @@ class TestPerformance:
         assert avg_response_time < 10.0  # Average less than 10 seconds
         assert max_response_time < 20.0  # No single request over 20 seconds
     
-    def test_memory_usage_multiple_requests(self, client):
+    def test_memory_usage_multiple_requests(self, api_client):
         """Test memory doesn't leak with multiple requests"""
-        import psutil
-        import os
-        
-        process = psutil.Process(os.getpid())
-        initial_memory = process.memory_info().rss / 1024 / 1024  # MB
-        
-        # Make multiple requests
-        for i in range(50):
-            response = client.post(
-                "/convert/",
-                json={"url": "invalid-url"}
-            )
-            assert response.status_code == 500
+        if resource is None and psutil is None:
+            pytest.skip("Neither resource nor psutil is available")
+        
+        gc.collect()
+        initial_memory = _memory_mb()
+        
+        # Make multiple requests; keep the collector out of the loop so
+        # generational collections don't perturb the measurement
+        gc.disable()
+        try:
+            for i in range(10):
+                response = api_client.post(
+                    "/convert/",
+                    json={"url": "invalid-url"}
+                )
+                assert response.status_code == 500
+        finally:
+            gc.enable()
         
-        final_memory = process.memory_info().rss / 1024 / 1024  # MB
+        gc.collect()
+        final_memory = _memory_mb()
         memory_increase = final_memory - initial_memory
         
         print(f"Initial memory: {initial_memory:.1f} MB")
@@ -128,10 +165,10 @@ class TestPerformance:
         assert memory_increase < 100  # Less than 100MB increase
     
     @pytest.mark.slow
-    def test_timeout_handling(self, client):
+    def test_timeout_handling(self, api_client):
         """Test that requests don't hang indefinitely"""
         # Test with an invalid URL that should fail quickly
-        response = client.post(
+        response = api_client.post(
             "/convert/",
             json={"url": "https://www.youtube.com/watch?v=invalid-video-id-12345"},
             timeout=10  # 10 second timeout should be sufficient for error response
@@ -145,46 +182,38 @@ class TestPerformance:
 class TestLoadTesting:
     """Load testing for the API"""
     
-    @pytest.fixture
-    def client(self):
-        """Create test client"""
-        return TestClient(app)
-    
-    def test_load_test_invalid_requests(self, client):
+    @pytest.mark.asyncio
+    async def test_load_test_invalid_requests(self):
         """Simple load test with invalid requests"""
-        def make_request(request_id):
-            start_time = time.time()
+        async def make_request(client, request_id):
+            start_time = perf_counter_ns()
             try:
-                response = client.post(
+                response = await client.post(
                     "/convert/",
-                    json={"url": f"invalid-url-{request_id}"}
+                    content=(_INVALID_BODY_TEMPLATE % request_id).encode(),
+                    headers=_JSON_HEADERS
                 )
                 success = response.status_code == 500
             except Exception as e:
                 success = False
             
-            end_time = time.time()
+            end_time = perf_counter_ns()
             return {
                 'request_id': request_id,
                 'success': success,
-                'response_time': end_time - start_time
+                'response_time': (end_time - start_time) / 1e9
             }
         
-        # Run 100 requests with 20 concurrent workers
+        # Run 100 concurrent requests against the ASGI app in-process
         num_requests = 100
-        max_workers = 20
         
-        start_time = time.time()
+        start_time = perf_counter_ns()
         
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [
-                executor.submit(make_request, i) 
-                for i in range(num_requests)
-            ]
-            results = [future.result() for future in as_completed(futures)]
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            results = await asyncio.gather(*[make_request(client, i) for i in range(num_requests)])
         
-        end_time = time.time()
-        total_time = end_time - start_time
+        end_time = perf_counter_ns()
+        total_time = (end_time - start_time) / 1e9
         
         # Analyze results
         successful_requests = sum(1 for result in results if result['success'])
@@ -192,7 +221,11 @@ class TestLoadTesting:
         
         if response_times:
             avg_response_time = statistics.mean(response_times)
-            percentile_95 = sorted(response_times)[int(0.95 * len(response_times))]
+            # quantiles() needs at least two samples
+            if len(response_times) > 1:
+                percentile_95 = statistics.quantiles(response_times, n=100, method="inclusive")[94]
+            else:
+                percentile_95 = response_times[0]
         else:
             avg_response_time = float('inf')
             percentile_95 = float('inf')
@@ -210,10 +243,3 @@ class TestLoadTesting:
         assert successful_requests >= num_requests * 0.95  # At least 95% success rate
         assert requests_per_second > 1  # At least 1 request per second
         assert avg_response_time < 30  # Average response time under 30 seconds
-
-
-if __name__ == "__main__":
-    # Run performance tests: python -m pytest tests/test_performance.py -v -m "performance"
-    # Run load tests: python -m pytest tests/test_performance.py -v -m "load"
-    # Run all: python -m pytest tests/test_performance.py -v
-    pytest.main([__file__, "-v"])
\ No newline at end of file
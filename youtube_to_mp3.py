@@ -1,132 +1,528 @@
+import asyncio
+import hashlib
+import http.client
+import http.cookiejar
+import json
+import logging
 import os
-from io import BytesIO
-from tempfile import NamedTemporaryFile
+import re
+import socket
+import subprocess  # nosec B404 - only used to run ffmpeg with a fixed argument list
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from tempfile import SpooledTemporaryFile, TemporaryFile
+from typing import Literal, Optional
+from urllib.error import HTTPError, URLError
+from urllib.parse import quote
 
-from pytubefix import YouTube
+import pytubefix
+import requests
+from requests.adapters import HTTPAdapter
+from cachetools import TTLCache
+from pytubefix import YouTube, extract, request as pytube_request
+from pytubefix.exceptions import BotDetection, PoTokenRequired, RegexMatchError
 from pytubefix.helpers import reset_cache
-try:
-    # Try MoviePy v2.x import first
-    from moviepy import AudioFileClip
-except ImportError:
-    try:
-        # Fall back to MoviePy v1.x import
-        from moviepy.editor import AudioFileClip
-    except ImportError as e:
-        raise ImportError(f"Could not import AudioFileClip from moviepy: {e}")
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
 
-app = FastAPI()
+_LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# getLevelName() maps known names to their number and anything else to a string
+_log_level_number = logging.getLevelName(_LOG_LEVEL.upper())
+logging.basicConfig(level=_log_level_number if isinstance(_log_level_number, int) else logging.INFO)
+logger = logging.getLogger(__name__)
+if not isinstance(_log_level_number, int):
+    logger.warning("Unknown LOG_LEVEL %r, using INFO", _LOG_LEVEL)
 
-reset_cache()
+app = FastAPI()
 
 # PoToken mode constants
 POTOKEN_MODE_AUTO = "AUTO"
 POTOKEN_MODE_MANUAL = "MANUAL"
 
+
+@dataclass(frozen=True)
+class _PoCfg:
+    """PoToken configuration, read from the environment once at startup"""
+    mode: str
+    token: Optional[str]
+    visitor: Optional[str]
+
+
+_PO = _PoCfg(
+    mode=os.getenv("PO_TOKEN_MODE", POTOKEN_MODE_AUTO).upper(),  # AUTO or MANUAL
+    token=os.getenv("PO_TOKEN"),
+    visitor=os.getenv("VISITOR_DATA"),
+)
+
+
+def _youtube_options(po):
+    """Log message and YouTube() keyword arguments for a PoToken configuration"""
+    if po.mode == POTOKEN_MODE_AUTO:
+        # Automatic PoToken generation with WEB client (requires nodejs)
+        return "Using automatic PoToken generation with WEB client", {
+            "client": "WEB",
+            "use_oauth": False,
+            "allow_oauth_cache": True,
+        }
+    if po.token and po.mode == POTOKEN_MODE_MANUAL:
+        # Manual PoToken mode with extracted token and, if set, visitor data
+        kwargs = {"use_po_token": True, "po_token": po.token}
+        if po.visitor:
+            kwargs["visitor_data"] = po.visitor
+        kwargs.update(use_oauth=False, allow_oauth_cache=True)
+        return "Using manual PoToken with extracted token", kwargs
+    # Default mode without PoToken
+    return "Using default YouTube client (no PoToken)", {
+        "use_oauth": False,
+        "allow_oauth_cache": True,
+    }
+
+
+_YT_MODE_MESSAGE, _YT_KWARGS = _youtube_options(_PO)
+logger.info(_YT_MODE_MESSAGE)
+
+# Output container constants
+CONTAINER_MP3 = "mp3"
+CONTAINER_M4A = "m4a"
+
+# Characters that are invalid in filenames (incl. control characters)
+_SANITIZE = re.compile(r'[\\/:*?"<>|\x00-\x1f\x7f]')
+# Everything outside printable ASCII, replaced in the plain filename= fallback
+_NON_ASCII = re.compile(r"[^\x20-\x7e]")
+
+# ffmpeg reads the m4a from stdin and writes the MP3 to stdout; decoding,
+# resampling and encoding run on separate threads (libmp3lame itself is single-threaded)
+FFMPEG_MP3_CMD = [
+    "ffmpeg", "-loglevel", "error", "-filter_threads", "0", "-i", "pipe:0",
+    "-vn", "-threads", "0", "-c:a", "libmp3lame", "-q:a", "4", "-f", "mp3", "pipe:1",
+]
+
+
+# Finished MP3 conversions keyed by video ID, bounded by total size in bytes
+MP3_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Larger MP3s are streamed but not cached, so a response never buffers more than this
+MP3_CACHE_MAX_ENTRY_BYTES = 32 * 1024 * 1024
+MP3_CACHE_TTL = 3600
+_MP3_CACHE = TTLCache(maxsize=MP3_CACHE_MAX_BYTES, ttl=MP3_CACHE_TTL, getsizeof=lambda entry: len(entry[0]))
+
+# Errors after which pytubefix's cached player/token data is likely stale
+_STALE_CACHE_ERRORS = (RegexMatchError, BotDetection, PoTokenRequired)
+# Only one worker thread resets pytubefix's cache at a time; the generation
+# counts resets so requests that failed together only trigger one of them
+_reset_lock = threading.Lock()
+_reset_generation = 0
+
+# Conversions running at once; each holds a download thread and an ffmpeg process
+MAX_CONVERSIONS = (os.cpu_count() or 1) * 2
+
+# Pool for all blocking work of a conversion (lookup, download, reading ffmpeg's
+# output); as large as MAX_CONVERSIONS so every running conversion has a thread
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONVERSIONS)
+
+# One semaphore per event loop, asyncio primitives must not be shared between loops
+_CONVERSION_SLOTS = weakref.WeakKeyDictionary()
+
+# Size of the MP3 chunks streamed to the client
+CHUNK_SIZE = 64 * 1024
+
+# Amount of ffmpeg's stderr reported in conversion errors
+STDERR_TAIL_BYTES = 4 * 1024
+
+# m4a passthrough downloads stay in memory up to this size, larger ones spill to disk
+M4A_SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+# _execute_request below mirrors this pytubefix release; other versions keep urlopen()
+_PYTUBEFIX_PATCHED_VERSION = "10.2.1"
+
+# One keep-alive connection pool for all pytubefix requests instead of a new
+# TLS handshake per urlopen() call
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+# Stateless like urlopen(): never store or send cookies, which would otherwise be
+# shared between all users and could clash with the configured VISITOR_DATA
+_SESSION.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+
+
+class _SessionResponse:
+    """Minimal urlopen()-style wrapper around a streamed requests response"""
+
+    def __init__(self, response):
+        self._response = response
+        self._consumed = False
+
+    def read(self):
+        # urlopen() responses return the whole body once, then b""
+        if self._consumed:
+            return b""
+        self._consumed = True
+        chunks = []
+        try:
+            for chunk in self._response.iter_content(CHUNK_SIZE):
+                chunks.append(chunk)
+        except requests.RequestException as e:
+            self._response.close()
+            # pytubefix resumes range downloads from IncompleteRead.partial
+            raise http.client.IncompleteRead(b"".join(chunks)) from e
+        return b"".join(chunks)
+
+    def info(self):
+        return self._response.headers
+
+
+def _execute_request(url, method=None, headers=None, data=None, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+    """Drop-in replacement for pytubefix.request._execute_request using _SESSION"""
+    base_headers = {"User-Agent": "Mozilla/5.0", "accept-language": "en-US,en"}
+    if headers:
+        base_headers.update(headers)
+    if data and not isinstance(data, bytes):
+        data = json.dumps(data).encode("utf-8")
+    if not url.lower().startswith("http"):
+        raise ValueError("Invalid URL")
+    if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+        timeout = None
+    try:
+        # Streamed so that header-only lookups never download the body
+        response = _SESSION.request(
+            method or ("POST" if data else "GET"),
+            url,
+            headers=base_headers,
+            data=data,
+            timeout=timeout,
+            stream=True,
+        )
+    except requests.RequestException as e:
+        # pytubefix retries on URLError, keep that behaviour
+        raise URLError(e) from e
+    if response.status_code >= 400:
+        response.close()
+        raise HTTPError(url, response.status_code, response.reason, response.headers, None)
+    return _SessionResponse(response)
+
+
+if pytubefix.__version__ == _PYTUBEFIX_PATCHED_VERSION:
+    pytube_request._execute_request = _execute_request
+else:
+    logger.warning(
+        "pytubefix %s is not %s, not replacing its HTTP client",
+        pytubefix.__version__, _PYTUBEFIX_PATCHED_VERSION,
+    )
+
+
+class _Mp3Transcoder:
+    """ffmpeg process converting an audio stream to MP3 on the fly"""
+
+    def __init__(self, stream):
+        # stderr goes to a file: an unread pipe would fill up and stall ffmpeg
+        self._stderr = TemporaryFile()
+        self._proc = subprocess.Popen(  # nosec B603 - fixed ffmpeg command, no shell
+            FFMPEG_MP3_CMD,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self._stderr,
+        )
+        self._errors = []
+        # Feed ffmpeg from a thread so its output can be streamed while downloading
+        self._feeder = threading.Thread(target=self._feed, args=(stream,), daemon=True)
+        self._feeder.start()
+
+    def _feed(self, stream):
+        try:
+            stream.stream_to_buffer(self._proc.stdin)
+        except BrokenPipeError:
+            # ffmpeg exited early, its exit code and stderr tell why
+            pass
+        except Exception as e:
+            self._errors.append(e)
+        finally:
+            try:
+                self._proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    def read(self):
+        """Blocking read of the next MP3 chunk, empty once ffmpeg is done"""
+        return self._proc.stdout.read(CHUNK_SIZE)
+
+    def finish(self):
+        """Wait for the download and ffmpeg, raising if either failed"""
+        self._feeder.join()
+        if self._proc.wait() != 0:
+            raise subprocess.CalledProcessError(self._proc.returncode, FFMPEG_MP3_CMD, stderr=self._stderr_tail())
+        if self._errors:
+            raise self._errors[0]
+
+    def _stderr_tail(self):
+        """Last STDERR_TAIL_BYTES of ffmpeg's error output"""
+        size = self._stderr.seek(0, os.SEEK_END)
+        self._stderr.seek(max(0, size - STDERR_TAIL_BYTES))
+        return self._stderr.read()
+
+    def close(self):
+        """Stop ffmpeg if it is still running and release its pipes"""
+        if self._proc.poll() is None:
+            self._proc.kill()
+        self._proc.stdout.close()
+        self._proc.wait()
+        self._stderr.close()
+
+
+def _conversion_slots():
+    """Semaphore limiting the conversions running on the current event loop"""
+    loop = asyncio.get_running_loop()
+    slots = _CONVERSION_SLOTS.get(loop)
+    if slots is None:
+        slots = _CONVERSION_SLOTS[loop] = asyncio.Semaphore(MAX_CONVERSIONS)
+    return slots
+
+
+class _ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that runs a cleanup callback once it is done
+
+    Unlike a finally block in the body iterator this also runs when the client
+    disconnects before the first chunk was requested.
+    """
+
+    def __init__(self, content, close, **kwargs):
+        super().__init__(content, **kwargs)
+        self._close = close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._close()
+
+
+async def _iter_mp3(transcoder, first_chunk, video_id=None, title=None):
+    """Stream ffmpeg's output without blocking the event loop"""
+    # Keep a copy for the cache unless the file is too large for a single entry
+    chunks = [] if video_id else None
+    size = 0
+    loop = asyncio.get_running_loop()
+    try:
+        chunk = first_chunk
+        while chunk:
+            yield chunk
+            if chunks is not None:
+                size += len(chunk)
+                chunks.append(chunk)
+                if size > MP3_CACHE_MAX_ENTRY_BYTES:
+                    chunks = None
+            chunk = await loop.run_in_executor(_EXECUTOR, transcoder.read)
+        await loop.run_in_executor(_EXECUTOR, transcoder.finish)
+        if chunks is not None:
+            _MP3_CACHE[video_id] = (b"".join(chunks), title)
+    finally:
+        transcoder.close()
+
+
+def _content_disposition(title, extension):
+    """Attachment header with an ASCII fallback and the UTF-8 filename (RFC 5987)"""
+    filename = _SANITIZE.sub("_", f"{title}.{extension}")
+    # Ersetzen statt weglassen, sonst bleibt bei rein nicht-lateinischen Titeln nur ".mp3"
+    fallback = _NON_ASCII.sub("_", filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+def _etag(video_id, wants_m4a):
+    """Weak ETag for a video in the given format
+
+    Weak because the encoder may produce different bytes for the same settings.
+    """
+    # The MP3 variant depends on the encoder settings, so they are part of the tag
+    variant = CONTAINER_M4A if wants_m4a else " ".join(FFMPEG_MP3_CMD)
+    digest = hashlib.sha1(f"{video_id}:{variant}".encode(), usedforsecurity=False).hexdigest()
+    return f'W/"{digest}"'
+
+
+def _etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value matches the ETag (weak comparison)"""
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def _video_id(url):
+    """Video ID of a YouTube URL, if present
+
+    Uses pytubefix's own parser so the ID always names the video YouTube(url) downloads.
+    """
+    try:
+        return extract.video_id(url)
+    except RegexMatchError:
+        return None
+
+
 class URLItem(BaseModel):
     url: str
 
 @app.get("/")
 async def status():
-    po_token_mode = os.getenv("PO_TOKEN_MODE", POTOKEN_MODE_AUTO).upper()
-    po_token_configured = bool(os.getenv("PO_TOKEN"))
-    visitor_data_configured = bool(os.getenv("VISITOR_DATA"))
-    
     return {
         "message": "YouTube to MP3 Service",
         "status": "running",
         "po_token": {
-            "mode": po_token_mode,
-            "po_token_configured": po_token_configured,
-            "visitor_data_configured": visitor_data_configured
+            "mode": _PO.mode,
+            "po_token_configured": bool(_PO.token),
+            "visitor_data_configured": bool(_PO.visitor)
         }
     }
 
 
+def _youtube(url):
+    """Create the YouTube object for the configured PoToken mode"""
+    return YouTube(url, **_YT_KWARGS)
+
+
+def _reset_cache_once(seen_generation):
+    """Reset pytubefix's cache unless another thread did since seen_generation"""
+    global _reset_generation
+    with _reset_lock:
+        if _reset_generation == seen_generation:
+            reset_cache()
+            _reset_generation += 1
+
+
+def _open_audio_stream(url):
+    """Resolve the audio-only stream and title of a video (blocking network I/O)"""
+    generation = _reset_generation
+    yt = _youtube(url)
+    try:
+        stream = yt.streams.get_audio_only()
+    except _STALE_CACHE_ERRORS:
+        # Token-/Player-Cache ist veraltet: einmal zurücksetzen und erneut versuchen
+        _reset_cache_once(generation)
+        yt = _youtube(url)
+        stream = yt.streams.get_audio_only()
+    if not stream:
+        raise HTTPException(status_code=404, detail="Kein Audiostream gefunden")
+
+    logger.info("Downloading: %s", yt.title)
+    return yt.title, stream
+
+
+def _download(stream):
+    """Download the whole audio stream, spilling to disk when large (blocking I/O)"""
+    buf = SpooledTemporaryFile(max_size=M4A_SPOOL_MAX_BYTES, suffix=".m4a")
+    try:
+        stream.stream_to_buffer(buf)
+        size = buf.tell()
+        buf.seek(0)
+    except BaseException:
+        buf.close()
+        raise
+    return buf, size
+
+
+async def _iter_file(buf):
+    """Stream a downloaded file in chunks without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    try:
+        chunk = await loop.run_in_executor(_EXECUTOR, buf.read, CHUNK_SIZE)
+        while chunk:
+            yield chunk
+            chunk = await loop.run_in_executor(_EXECUTOR, buf.read, CHUNK_SIZE)
+    finally:
+        buf.close()
+
+
 @app.post("/convert/")
-async def convert(url_item: URLItem):
+async def convert(url_item: URLItem, request: Request, container: Literal["mp3", "m4a"] = CONTAINER_MP3):
     try:
-        # Get PoToken configuration from environment variables
-        po_token = os.getenv("PO_TOKEN")
-        visitor_data = os.getenv("VISITOR_DATA")
-        po_token_mode = os.getenv("PO_TOKEN_MODE", POTOKEN_MODE_AUTO).upper()  # AUTO or MANUAL
-        
-        # Configure YouTube instance based on PoToken settings
-        if po_token_mode == POTOKEN_MODE_AUTO:
-            # Automatic PoToken generation with WEB client (requires nodejs)
-            print(f"Using automatic PoToken generation with WEB client")
-            yt = YouTube(
-                url_item.url,
-                client='WEB',
-                use_oauth=False,
-                allow_oauth_cache=True
-            )
-        elif po_token and po_token_mode == POTOKEN_MODE_MANUAL:
-            # Manual PoToken mode with extracted token and visitor data
-            print(f"Using manual PoToken with extracted token")
-            if visitor_data:
-                yt = YouTube(
-                    url_item.url,
-                    use_po_token=True,
-                    po_token=po_token,
-                    visitor_data=visitor_data,
-                    use_oauth=False,
-                    allow_oauth_cache=True
-                )
-            else:
-                yt = YouTube(
-                    url_item.url,
-                    use_po_token=True,
-                    po_token=po_token,
-                    use_oauth=False,
-                    allow_oauth_cache=True
+        accept = request.headers.get("accept", "")
+        wants_m4a = container == CONTAINER_M4A or "audio/mp4" in accept
+
+        # Format (und damit ETag und Inhalt) kann vom Accept-Header abhängen
+        video_id = _video_id(url_item.url)
+        cache_headers = {"Vary": "Accept"}
+        if video_id:
+            cache_headers["ETag"] = _etag(video_id, wants_m4a)
+
+        # Client hat die Datei schon – bei POST verlangt RFC 9110 dafür 412 statt 304
+        if_none_match = request.headers.get("if-none-match")
+        if video_id and if_none_match and _etag_matches(if_none_match, cache_headers["ETag"]):
+            return Response(status_code=412, headers=cache_headers)
+
+        # Bereits konvertierte MP3s direkt aus dem Cache ausliefern
+        cached = _MP3_CACHE.get(video_id) if video_id and not wants_m4a else None
+        if cached is not None:
+            mp3_data, title = cached
+            headers = {
+                "Content-Disposition": _content_disposition(title, CONTAINER_MP3),
+                **cache_headers,
+            }
+            return Response(mp3_data, media_type="audio/mpeg", headers=headers)
+
+        # Nebenläufige Konvertierungen (Download-Thread + ffmpeg) begrenzen
+        slots = _conversion_slots()
+        await slots.acquire()
+        release = slots.release
+        try:
+            # pytubefix blockiert – im Thread-Pool ausführen, damit der Event-Loop frei bleibt
+            loop = asyncio.get_running_loop()
+            title, stream = await loop.run_in_executor(_EXECUTOR, _open_audio_stream, url_item.url)
+
+            # AAC-Stream direkt als m4a ausliefern, wenn der Client das akzeptiert
+            if wants_m4a and "mp4a" in (stream.audio_codec or ""):
+                buf, size = await loop.run_in_executor(_EXECUTOR, _download, stream)
+
+                headers = {
+                    "Content-Disposition": _content_disposition(title, CONTAINER_M4A),
+                    **cache_headers,
+                }
+                if size <= M4A_SPOOL_MAX_BYTES:
+                    # Liegt noch im Arbeitsspeicher – in einem Stück senden
+                    with buf:
+                        return Response(buf.read(), media_type="audio/mp4", headers=headers)
+                # Auf die Platte ausgelagert – stückweise aus der Datei senden
+                headers["Content-Length"] = str(size)
+                return _ClosingStreamingResponse(
+                    _iter_file(buf), buf.close, media_type="audio/mp4", headers=headers
                 )
-        else:
-            # Default mode without PoToken
-            print(f"Using default YouTube client (no PoToken)")
-            yt = YouTube(
-                url_item.url,
-                use_oauth=False,
-                allow_oauth_cache=True
-            )
 
-        stream = yt.streams.get_audio_only()
-        if not stream:
-            raise HTTPException(status_code=404, detail="Kein Audiostream gefunden")
-
-        print(f"Downloading: {yt.title}")
-        # Lade m4a in temp Datei
-        with NamedTemporaryFile(suffix=".m4a", delete=False) as tmp_in:
-            tmp_in_path = tmp_in.name
-            stream.stream_to_buffer(tmp_in)
-            tmp_in.flush()
-
-        # MoviePy braucht einen Dateipfad – also auslesen, konvertieren
-        with NamedTemporaryFile(suffix=".mp3", delete=False) as tmp_out:
-            tmp_out_path = tmp_out.name
-
-        clip = AudioFileClip(tmp_in_path)
-        clip.write_audiofile(tmp_out_path)
-        clip.close()
-
-        # MP3 in Speicher laden
-        with open(tmp_out_path, "rb") as f:
-            mp3_data = f.read()
-
-        # Temporäre Dateien löschen
-        os.remove(tmp_in_path)
-        os.remove(tmp_out_path)
-
-        # In-Memory zurückgeben
-        buf = BytesIO(mp3_data)
-        buf.seek(0)
-        filename = f"{yt.title}.mp3".replace("/", "_")
-        headers = {
-            "Content-Disposition": f'attachment; filename="{filename}"'
-        }
-        return StreamingResponse(buf, media_type="audio/mpeg", headers=headers)
+            # Kein AAC-Stream – es wird doch MP3 ausgeliefert, also gilt dessen ETag
+            if wants_m4a and video_id:
+                cache_headers["ETag"] = _etag(video_id, False)
+                if if_none_match and _etag_matches(if_none_match, cache_headers["ETag"]):
+                    return Response(status_code=412, headers=cache_headers)
+
+            # m4a direkt durch ffmpeg pipen und das MP3 stückweise ausliefern
+            transcoder = _Mp3Transcoder(stream)
+            try:
+                first_chunk = await loop.run_in_executor(_EXECUTOR, transcoder.read)
+                if not first_chunk:
+                    # Keine Ausgabe – ffmpeg-Fehler melden, solange noch keine Header gesendet sind
+                    await loop.run_in_executor(_EXECUTOR, transcoder.finish)
+            except BaseException:
+                transcoder.close()
+                raise
+
+            def close():
+                # ffmpeg läuft bis zum Ende der Antwort, erst dann den Platz freigeben
+                try:
+                    transcoder.close()
+                finally:
+                    slots.release()
+
+            headers = {
+                "Content-Disposition": _content_disposition(title, CONTAINER_MP3),
+                **cache_headers,
+            }
+            response = _ClosingStreamingResponse(
+                _iter_mp3(transcoder, first_chunk, video_id, title), close,
+                media_type="audio/mpeg", headers=headers,
+            )
+            release = None
+            return response
+        finally:
+            if release is not None:
+                release()
 
+    except subprocess.CalledProcessError as e:
+        raise HTTPException(status_code=500, detail=f"Fehler: {e.stderr.decode(errors='replace')}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Fehler: {e}")